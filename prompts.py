@@ -2,18 +2,11 @@
 #
 # Prompts help guide Claude through OAuth authentication workflows
 
-def register_prompts(mcp):
-    """Register all MCP prompts with the FastMCP server."""
+import logging
 
-    @mcp.prompt()
-    def device_code_auth_workflow():
-        """
-        Complete guide for Device Code authentication flow.
+logger = logging.getLogger(__name__)
 
-        This is the recommended authentication method for interactive use
-        with Claude Desktop.
-        """
-        return """I'll guide you through Device Code authentication to get a bearer token.
+_DEVICE_CODE_PROMPT = """I'll guide you through Device Code authentication to get a bearer token.
 
 **Device Code Flow (User Authentication)**
 
@@ -57,14 +50,7 @@ get_pending_approvals(
 Type: "start device authentication"
 """
 
-    @mcp.prompt()
-    def client_credentials_auth_workflow():
-        """
-        Guide for Client Credentials authentication flow.
-
-        This is for app-only scenarios where no user interaction is needed.
-        """
-        return """I'll guide you through Client Credentials authentication.
+_CLIENT_CREDENTIALS_PROMPT = """I'll guide you through Client Credentials authentication.
 
 **Client Credentials Flow (App-Only Authentication)**
 
@@ -113,12 +99,7 @@ Check your AUTH_METHOD in .env:
 Type "get azure token" to authenticate with client credentials.
 """
 
-    @mcp.prompt()
-    def troubleshooting_auth():
-        """
-        Common authentication troubleshooting tips.
-        """
-        return """Here are solutions to common authentication issues:
+_TROUBLESHOOTING_PROMPT = """Here are solutions to common authentication issues:
 
 **Issue: "Device code has expired"**
 Solution: Device codes expire after 15 minutes. Start a fresh auth:
@@ -173,4 +154,34 @@ Check the log file: oauth_mcp_server.log
 Enable debug logging: Set LOG_LEVEL=DEBUG in .env
 """
 
-    print("Registered 3 MCP prompts: device_code_auth_workflow, client_credentials_auth_workflow, troubleshooting_auth")
+
+def register_prompts(mcp):
+    """Register all MCP prompts with the FastMCP server."""
+
+    @mcp.prompt()
+    def device_code_auth_workflow():
+        """
+        Complete guide for Device Code authentication flow.
+
+        This is the recommended authentication method for interactive use
+        with Claude Desktop.
+        """
+        return _DEVICE_CODE_PROMPT
+
+    @mcp.prompt()
+    def client_credentials_auth_workflow():
+        """
+        Guide for Client Credentials authentication flow.
+
+        This is for app-only scenarios where no user interaction is needed.
+        """
+        return _CLIENT_CREDENTIALS_PROMPT
+
+    @mcp.prompt()
+    def troubleshooting_auth():
+        """
+        Common authentication troubleshooting tips.
+        """
+        return _TROUBLESHOOTING_PROMPT
+
+    logger.info("Registered 3 MCP prompts: device_code_auth_workflow, client_credentials_auth_workflow, troubleshooting_auth")
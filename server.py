@@ -9,50 +9,189 @@ Implements:
 """
 
 import os
+import sys
 import logging
-import json
+from logging.handlers import MemoryHandler, RotatingFileHandler
 import asyncio
+import functools
+import math
+import random
+import time
 import httpx
-from typing import Dict, Any
+import orjson
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from mcp.server.fastmcp import FastMCP
+from prompts import register_prompts
 
 # Load environment variables
 load_dotenv()
 
+# Paths are resolved relative to the directory where this script is located
+_SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
 # Configure logging system
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 LOG_FILE = os.getenv("LOG_FILE", "oauth_mcp_server.log")
 
 # Convert to absolute path if relative path provided
 if not os.path.isabs(LOG_FILE):
-    # Use the directory where this script is located
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    LOG_FILE = os.path.join(script_dir, LOG_FILE)
+    LOG_FILE = os.path.join(_SCRIPT_DIR, LOG_FILE)
 
 # Create logs directory if it doesn't exist
 log_dir = os.path.dirname(LOG_FILE)
-if log_dir and not os.path.exists(log_dir):
-    os.makedirs(log_dir)
+if log_dir:
+    os.makedirs(log_dir, exist_ok=True)
+
+# Rotate the log file at 10 MB, and buffer file writes so debug logging in the
+# token polling loop doesn't hit the disk on every record. The buffer is flushed
+# every 200 records, on any WARNING or above, and at shutdown.
+file_handler = RotatingFileHandler(LOG_FILE, maxBytes=10_000_000, backupCount=3, delay=True, encoding='utf-8')
+buffered_file_handler = MemoryHandler(capacity=200, flushLevel=logging.WARNING, target=file_handler)
 
-# Configure logging with both file and console handlers
+# Configure logging with both file and console handlers.
+# Console output must go to stderr: stdout carries the MCP stdio JSON-RPC stream.
 logging.basicConfig(
     level=getattr(logging, LOG_LEVEL, logging.INFO),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.FileHandler(LOG_FILE, encoding='utf-8'),
-        logging.StreamHandler()
+        buffered_file_handler,
+        logging.StreamHandler(sys.stderr)
     ]
 )
+# basicConfig only sets the formatter on the handlers it is given
+file_handler.setFormatter(buffered_file_handler.formatter)
 logger = logging.getLogger(__name__)
-logger.info(f"Logging initialized. Writing logs to: {os.path.abspath(LOG_FILE)}")
+logger.info(f"Logging initialized. Writing logs to: {LOG_FILE}")
+
+def _dump(obj: Any) -> str:
+    """Serialize a tool response as indented JSON (datetimes as ISO 8601)."""
+    return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+
+
+def _error_response(message: str, error_type: str) -> str:
+    """Serialize the standard tool error response."""
+    return _dump({
+        "status": "error",
+        "message": message,
+        "error_type": error_type
+    })
+
+
+@dataclass(frozen=True)
+class AuthConfig:
+    """Azure AD settings read once from the environment at startup."""
+    auth_method: str
+    tenant_id: Optional[str]
+    client_id: Optional[str]
+    client_secret: Optional[str] = field(repr=False)
+    access_token_url: Optional[str]
+    scope: Optional[str]
+    device_auth_url: str
+    token_url: str
+
+    @classmethod
+    def from_env(cls) -> "AuthConfig":
+        tenant_id = os.getenv("TENANT_ID")
+        return cls(
+            auth_method=os.getenv("AUTH_METHOD", "DEVICE_CODE").upper(),
+            tenant_id=tenant_id,
+            client_id=os.getenv("CLIENT_ID"),
+            client_secret=os.getenv("CLIENT_SECRET"),
+            access_token_url=os.getenv("ACCESS_TOKEN_URL"),
+            scope=os.getenv("OAUTH2_SCOPE"),
+            device_auth_url=f"https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/devicecode",
+            token_url=f"https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/token"
+        )
+
+
+_DEFAULT_API_SCOPE = "api://08eeb6a4-4aee-406f-baa5-4922993f09f3/.default"
+_DEFAULT_GRAPH_SCOPE = "https://graph.microsoft.com/.default"
+
+_FORM_HEADERS = {"Content-Type": "application/x-www-form-urlencoded"}
+
+CFG = AuthConfig.from_env()
+if not CFG.tenant_id or not CFG.client_id:
+    logger.warning("TENANT_ID and CLIENT_ID are not set - device authentication will fail until they are configured")
+
+
+# Shared HTTP client so every Azure AD request reuses one pooled TLS connection
+_HTTP_CLIENT: Optional[httpx.AsyncClient] = None
+
+# Host serving both the device code and token endpoints
+_AZURE_LOGIN_URL = "https://login.microsoftonline.com/"
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared HTTP client, creating it on first use."""
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None or _HTTP_CLIENT.is_closed:
+        _HTTP_CLIENT = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=120),
+            timeout=httpx.Timeout(10.0)
+        )
+    return _HTTP_CLIENT
+
+
+async def _warm_up_client() -> None:
+    """
+    Open a connection to Azure AD so the first token request skips DNS and the TLS handshake.
+
+    The pooled connection is only kept for the client's keepalive_expiry (120s),
+    so this only helps if the first auth tool call comes within that window.
+    """
+    try:
+        await get_client().head(_AZURE_LOGIN_URL)
+        logger.debug("Warmed up connection to %s", _AZURE_LOGIN_URL)
+    except Exception as e:
+        logger.warning(f"Connection warm-up to {_AZURE_LOGIN_URL} failed: {e}")
+
+
+# Number of MCP sessions inside server_lifespan. SSE and streamable-HTTP
+# transports run the lifespan once per session, so the process-wide client is
+# only closed when the last session ends.
+_ACTIVE_SESSIONS = 0
+
+
+@asynccontextmanager
+async def server_lifespan(server: FastMCP) -> AsyncIterator[None]:
+    """
+    Warm up the shared HTTP client on startup and close it once the last
+    session has shut down.
+
+    Relies on mcp>=1.30.0, where the server only leaves the lifespan after
+    cancelling every in-flight tool call, so token polling stops promptly when
+    the client disconnects or the server shuts down.
+    """
+    global _HTTP_CLIENT, _ACTIVE_SESSIONS
+    _ACTIVE_SESSIONS += 1
+    # Runs alongside startup so the server doesn't wait on the network to come up
+    warm_up = asyncio.create_task(_warm_up_client())
+    try:
+        yield
+    finally:
+        warm_up.cancel()
+        _ACTIVE_SESSIONS -= 1
+        if _ACTIVE_SESSIONS == 0 and _HTTP_CLIENT is not None:
+            await _HTTP_CLIENT.aclose()
+            _HTTP_CLIENT = None
+
 
 # Initialize FastMCP server
-mcp = FastMCP("OAuth MCP Server")
+mcp = FastMCP("OAuth MCP Server", lifespan=server_lifespan)
+
+# Pending device authorizations keyed by user_code, bridging start_device_auth and
+# complete_device_auth. Both tools run in this process, so nothing is written to disk.
+_DEVICE_CODE_CACHE: Dict[str, Dict[str, Any]] = {}
+
+ENABLE_ONE_STEP_DEVICE_FLOW = os.getenv("ENABLE_ONE_STEP_DEVICE_FLOW", "false").lower() == "true"
 
 # Register MCP Prompts for workflow guidance
-from prompts import register_prompts
 register_prompts(mcp)
 
 @mcp.tool()
@@ -70,10 +209,10 @@ class AzureOAuth2Client:
     """OAuth 2.0 Client Credentials flow for app-only authentication."""
 
     def __init__(self):
-        self.tenant_id = os.getenv("TENANT_ID")
-        self.client_id = os.getenv("CLIENT_ID")
-        self.client_secret = os.getenv("CLIENT_SECRET")
-        self.access_token_url = os.getenv("ACCESS_TOKEN_URL")
+        self.tenant_id = CFG.tenant_id
+        self.client_id = CFG.client_id
+        self.client_secret = CFG.client_secret
+        self.access_token_url = CFG.access_token_url
 
         # Validate required environment variables
         if not all([self.tenant_id, self.client_id, self.client_secret]):
@@ -83,6 +222,13 @@ class AzureOAuth2Client:
         if not self.access_token_url:
             self.access_token_url = f"https://login.microsoftonline.com/{self.tenant_id}/oauth2/v2.0/token"
 
+        # Request body fields that are the same for every token request
+        self._base_data = {
+            "grant_type": "client_credentials",
+            "client_id": self.client_id,
+            "client_secret": self.client_secret
+        }
+
     async def get_access_token(self, scope: str = None) -> Dict[str, Any]:
         """
         Get an OAuth2 access token using client credentials flow.
@@ -95,53 +241,62 @@ class AzureOAuth2Client:
         """
         # Use environment variable scope if none provided
         if scope is None:
-            scope = os.getenv("OAUTH2_SCOPE", "api://08eeb6a4-4aee-406f-baa5-4922993f09f3/.default")
+            scope = CFG.scope or _DEFAULT_API_SCOPE
 
-        headers = {
-            "Content-Type": "application/x-www-form-urlencoded"
-        }
-
-        data = {
-            "grant_type": "client_credentials",
-            "client_id": self.client_id,
-            "client_secret": self.client_secret,
-            "scope": scope
-        }
+        data = {**self._base_data, "scope": scope}
 
-        async with httpx.AsyncClient() as client:
+        client = get_client()
+        response = await client.post(
+            self.access_token_url,
+            headers=_FORM_HEADERS,
+            data=data,
+            timeout=30.0
+        )
+        if response.status_code >= 400:
             try:
-                response = await client.post(
-                    self.access_token_url,
-                    headers=headers,
-                    data=data,
-                    timeout=30.0
-                )
-                response.raise_for_status()
+                error_detail = orjson.loads(response.content)
+            except ValueError:
+                error_detail = response.text
+            raise Exception(f"Token request failed: HTTP {response.status_code}: {error_detail}")
+
+        token_data = orjson.loads(response.content)
 
-                token_data = response.json()
+        # Wall-clock expiry, for display only. Cache validity is tracked with
+        # monotonic deadlines on TokenEntry, which clock adjustments can't shift.
+        expires_in = token_data.get("expires_in", 3600)
+        token_data["expires_at"] = datetime.now() + timedelta(seconds=expires_in - 300)  # 5 min buffer
 
-                # Add expiry timestamp for caching
-                expires_in = token_data.get("expires_in", 3600)
-                from datetime import datetime, timedelta
-                token_data["expires_at"] = datetime.now() + timedelta(seconds=expires_in - 300)  # 5 min buffer
+        return token_data
 
-                return token_data
 
-            except httpx.HTTPStatusError as e:
-                error_detail = ""
-                try:
-                    error_detail = e.response.json()
-                except:
-                    error_detail = e.response.text
+@dataclass
+class TokenEntry:
+    """A cached access token with monotonic refresh and expiry deadlines."""
+    token_data: Dict[str, Any]
+    expires_at: float
+    refresh_at: float
+    expiry_handle: Optional[asyncio.TimerHandle] = None
+    # No background refresh is attempted before this time (set after a failed one)
+    retry_at: float = 0.0
 
-                raise Exception(f"HTTP {e.response.status_code}: {error_detail}")
-            except Exception as e:
-                raise Exception(f"Token request failed: {str(e)}")
 
+# Client Credentials tokens keyed by (tenant_id, client_id, scope). A token is
+# served from cache until 75% of its lifetime has passed, then refreshed in the
+# background while the cached token keeps being served until it expires. Expired
+# entries are evicted by a timer, so any entry present in the cache is usable.
+# The cache holds at most _TOKEN_CACHE_SIZE scopes, dropping the least recently used.
+_TOKEN_CACHE: "OrderedDict[Tuple[str, str, str], TokenEntry]" = OrderedDict()
+_TOKEN_CACHE_SIZE = 8
+_TOKEN_REFRESH_RATIO = 0.75
 
-# Initialize OAuth2 client and cached token
-_cached_token = None
+# Seconds to wait after a failed background refresh before trying again
+_REFRESH_RETRY_DELAY = 30.0
 
+# In-flight token requests per cache key. Concurrent callers await the same
+# task, so a burst of calls after expiry makes a single request to Azure AD.
+_TOKEN_REFRESHES: Dict[Tuple[str, str, str], asyncio.Task] = {}
+
+# Initialize OAuth2 client
 try:
     oauth_client = AzureOAuth2Client()
 except ValueError as e:
@@ -149,58 +304,84 @@ except ValueError as e:
     oauth_client = None
 
 
-# COMMENTED OUT: File-based token storage is deprecated - tokens are now handled in conversation context
-# async def get_token_from_device_code_file() -> Dict[str, Any]:
-#     """
-#     Get bearer token from device code authentication file.
-#
-#     Returns:
-#         Dict containing token information with access_token and expires_at
-#
-#     Raises:
-#         Exception if token file not found or invalid
-#     """
-#     token_file = os.getenv("DEVICE_CODE_TOKEN_FILE", "bearer_token.txt")
-#
-#     # Convert to absolute path if relative
-#     if not os.path.isabs(token_file):
-#         script_dir = os.path.dirname(os.path.abspath(__file__))
-#         token_file = os.path.join(script_dir, token_file)
-#
-#     if not os.path.exists(token_file):
-#         raise Exception(
-#             f"Device code token file not found: {token_file}\n"
-#             f"Please run device authentication flow first using the device_auth_mcp_server"
-#         )
-#
-#     try:
-#         with open(token_file, 'r') as f:
-#             token_data = json.load(f)
-#
-#         # Validate token structure
-#         if "access_token" not in token_data:
-#             raise Exception("Invalid token file: missing access_token field")
-#
-#         # Calculate expires_at if not present
-#         if "expires_at" not in token_data:
-#             if "expires_in" in token_data:
-#                 # Assume token was just created
-#                 expires_in = token_data.get("expires_in", 3600)
-#                 token_data["expires_at"] = datetime.now() + timedelta(seconds=expires_in - 300)  # 5 min buffer
-#             else:
-#                 # Default to 1 hour expiry with 5 min buffer
-#                 token_data["expires_at"] = datetime.now() + timedelta(seconds=3300)
-#         elif isinstance(token_data["expires_at"], str):
-#             # Convert string timestamp to datetime if needed
-#             token_data["expires_at"] = datetime.fromisoformat(token_data["expires_at"])
-#
-#         logger.debug(f"Loaded device code token from {token_file}")
-#         return token_data
-#
-#     except json.JSONDecodeError as e:
-#         raise Exception(f"Invalid JSON in token file {token_file}: {str(e)}")
-#     except Exception as e:
-#         raise Exception(f"Error reading device code token file: {str(e)}")
+def _token_cache_key(scope: Optional[str]) -> Tuple[str, str, str]:
+    """Build the token cache key for a scope (default: OAUTH2_SCOPE or Microsoft Graph)."""
+    if scope is None:
+        scope = CFG.scope or _DEFAULT_GRAPH_SCOPE
+    return (oauth_client.tenant_id, oauth_client.client_id, scope)
+
+
+async def _refresh_token(key: Tuple[str, str, str], force: bool = False) -> TokenEntry:
+    """
+    Return a fresh cached token for `key`, fetching a new one if needed.
+
+    Only one fetch per key is in flight at a time; concurrent callers share its
+    result. With `force`, the cached token is replaced even if still fresh.
+    """
+    entry = _TOKEN_CACHE.get(key)
+    if not force and entry is not None and time.monotonic() < entry.refresh_at:
+        return entry
+    # Shield the shared fetch so a cancelled caller doesn't cancel it for the others
+    return await asyncio.shield(_start_refresh(key))
+
+
+def _start_refresh(key: Tuple[str, str, str]) -> asyncio.Task:
+    """Return the in-flight fetch for `key`, starting one if none is running."""
+    task = _TOKEN_REFRESHES.get(key)
+    if task is None:
+        task = asyncio.create_task(_fetch_token(key))
+        _TOKEN_REFRESHES[key] = task
+        task.add_done_callback(functools.partial(_on_refresh_done, key))
+    return task
+
+
+async def _fetch_token(key: Tuple[str, str, str]) -> TokenEntry:
+    """Request a new Client Credentials token and store it in the cache."""
+    issued_at = time.monotonic()
+    token_data = await oauth_client.get_access_token(key[2])
+    expires_in = token_data.get("expires_in", 3600)
+    expires_at = issued_at + expires_in - 300  # 5 min buffer
+    entry = TokenEntry(
+        token_data=token_data,
+        expires_at=expires_at,
+        refresh_at=min(issued_at + expires_in * _TOKEN_REFRESH_RATIO, expires_at)
+    )
+    entry.expiry_handle = asyncio.get_running_loop().call_later(
+        max(expires_at - time.monotonic(), 0), _evict_token, key, entry
+    )
+    previous = _TOKEN_CACHE.pop(key, None)
+    if previous is not None and previous.expiry_handle is not None:
+        previous.expiry_handle.cancel()
+    _TOKEN_CACHE[key] = entry
+    while len(_TOKEN_CACHE) > _TOKEN_CACHE_SIZE:
+        _, evicted = _TOKEN_CACHE.popitem(last=False)
+        if evicted.expiry_handle is not None:
+            evicted.expiry_handle.cancel()
+    logger.info("New token acquired and cached via CLIENT_CREDENTIALS")
+    return entry
+
+
+def _evict_token(key: Tuple[str, str, str], entry: TokenEntry) -> None:
+    """Drop an expired token from the cache unless it has already been replaced."""
+    if _TOKEN_CACHE.get(key) is entry:
+        del _TOKEN_CACHE[key]
+        logger.debug("Evicted expired token for scope %s", key[2])
+
+
+def _on_refresh_done(key: Tuple[str, str, str], task: asyncio.Task) -> None:
+    if _TOKEN_REFRESHES.get(key) is task:
+        del _TOKEN_REFRESHES[key]
+    # Mark a failure as retrieved: if every awaiter was cancelled, nobody else
+    # reads it and asyncio would log "Task exception was never retrieved"
+    if not task.cancelled():
+        task.exception()
+
+
+def _on_background_refresh_done(entry: TokenEntry, task: asyncio.Task) -> None:
+    """Log a failed background refresh and hold off retrying it for a while."""
+    if not task.cancelled() and task.exception() is not None:
+        entry.retry_at = time.monotonic() + _REFRESH_RETRY_DELAY
+        logger.warning(f"Background token refresh failed: {task.exception()}")
 
 
 async def get_cached_token(scope: str = None) -> Dict[str, Any]:
@@ -211,6 +392,10 @@ async def get_cached_token(scope: str = None) -> Dict[str, Any]:
     - DEVICE_CODE: User delegated token via OAuth 2.0 Device Flow (default)
     - CLIENT_CREDENTIALS: OAuth 2.0 Client Credentials flow for app-only auth
 
+    Client Credentials tokens are cached per (tenant, client, scope). Past 75%
+    of their lifetime a background refresh is started while the cached token
+    is still returned; once expired, callers wait for a new token.
+
     Args:
         scope: OAuth2 scope for the token
 
@@ -220,25 +405,13 @@ async def get_cached_token(scope: str = None) -> Dict[str, Any]:
     Raises:
         Exception if AUTH_METHOD=DEVICE_CODE (token must be passed as parameter)
     """
-    global _cached_token
-
-    # Get authentication method from environment (default to DEVICE_CODE for user-delegated auth)
-    auth_method = os.getenv("AUTH_METHOD", "DEVICE_CODE").upper()
+    # Authentication method from environment (defaults to DEVICE_CODE for user-delegated auth)
+    auth_method = CFG.auth_method
 
     # Use environment variable scope if none provided
     if scope is None:
-        scope = os.getenv("OAUTH2_SCOPE", "https://graph.microsoft.com/.default")
-
-    # Check if we have a valid cached token
-    if (_cached_token and
-        "expires_at" in _cached_token and
-        datetime.now() < _cached_token["expires_at"]):
-        logger.debug(f"Using cached token (auth_method={auth_method})")
-        return _cached_token
+        scope = CFG.scope or _DEFAULT_GRAPH_SCOPE
 
-    logger.info(f"Token expired or not cached, acquiring new token using {auth_method}")
-
-    # Fetch new token based on auth method
     if auth_method == "DEVICE_CODE":
         raise Exception(
             "AUTH_METHOD is set to DEVICE_CODE - automatic token acquisition is disabled.\n"
@@ -255,9 +428,24 @@ async def get_cached_token(scope: str = None) -> Dict[str, Any]:
         if not oauth_client:
             raise Exception("OAuth2 client not initialized. Check CLIENT_SECRET environment variable.")
 
-        _cached_token = await oauth_client.get_access_token(scope)
-        logger.info("New token acquired and cached via CLIENT_CREDENTIALS")
-        return _cached_token
+        key = _token_cache_key(scope)
+        entry = _TOKEN_CACHE.get(key)
+
+        # Check if we have a valid cached token (expired entries are evicted)
+        if entry is not None:
+            _TOKEN_CACHE.move_to_end(key)
+            now = time.monotonic()
+            if now >= entry.refresh_at and now >= entry.retry_at and key not in _TOKEN_REFRESHES:
+                logger.debug("Cached token nearing expiry, refreshing in background")
+                _start_refresh(key).add_done_callback(
+                    functools.partial(_on_background_refresh_done, entry)
+                )
+            logger.debug("Using cached token (auth_method=%s)", auth_method)
+            return entry.token_data
+
+        logger.info(f"Token expired or not cached, acquiring new token using {auth_method}")
+        entry = await _refresh_token(key)
+        return entry.token_data
     else:
         raise Exception(
             f"Invalid AUTH_METHOD: {auth_method}\n"
@@ -265,158 +453,271 @@ async def get_cached_token(scope: str = None) -> Dict[str, Any]:
         )
 
 
+# Server info only depends on startup configuration, so serialize it once
+_SERVER_INFO_JSON = _dump({
+    "name": "OAuth MCP Server",
+    "version": "1.0.0",
+    "description": "MCP server for OAuth 2.0 authentication (Device Code & Client Credentials flows)",
+    "auth_method": CFG.auth_method,
+    "log_level": LOG_LEVEL,
+    "log_file": LOG_FILE,
+    "supported_flows": [
+        "OAuth 2.0 Device Authorization Grant (RFC 8628)",
+        "OAuth 2.0 Client Credentials (RFC 6749)"
+    ]
+})
+
+
 @mcp.tool()
 def get_server_info() -> str:
     """Get information about the OAuth MCP Server."""
-    auth_method = os.getenv("AUTH_METHOD", "DEVICE_CODE").upper()
-    info = {
-        "name": "OAuth MCP Server",
-        "version": "1.0.0",
-        "description": "MCP server for OAuth 2.0 authentication (Device Code & Client Credentials flows)",
-        "auth_method": auth_method,
-        "log_level": LOG_LEVEL,
-        "log_file": os.path.abspath(LOG_FILE),
-        "supported_flows": [
-            "OAuth 2.0 Device Authorization Grant (RFC 8628)",
-            "OAuth 2.0 Client Credentials (RFC 6749)"
-        ]
-    }
-    return str(info)
+    return _SERVER_INFO_JSON
+
 
 # OAuth 2.0 Device Authorization Grant Flow Implementation
 
+_DEVICE_GRANT = "urn:ietf:params:oauth:grant-type:device_code"
+
+# Device code request body; depends only on the startup configuration
+_DEVICE_FLOW_DATA = {
+    "client_id": CFG.client_id,
+    "scope": CFG.scope or _DEFAULT_API_SCOPE
+}
+
+# User-facing instructions for start_device_auth and device_auth_flow
+_INSTRUCTIONS_TEMPLATE = """
+DEVICE AUTHENTICATION REQUIRED
+
+Please complete these steps:
+
+1. Go to: {verification_uri}
+2. Enter code: {user_code}
+3. Sign in with your Microsoft credentials
+
+Code expires in: {expires_in} seconds ({minutes} minutes)
+
+After you complete authentication, ask me to "complete device authentication" to retrieve the token.
+"""
+
+_ONE_STEP_INSTRUCTIONS_TEMPLATE = """
+DEVICE AUTHENTICATION REQUIRED
+
+Please complete authentication NOW:
+
+1. Go to: {verification_uri}
+2. Enter code: {user_code}
+3. Sign in with your credentials
+
+Code expires in: {expires_in} seconds
+Polling for token until the code expires...
+"""
+
 async def initiate_device_flow() -> Dict[str, Any]:
     """
     Step 1: Initiate the device authorization flow.
 
     Returns device_code, user_code, verification_uri, and other parameters.
     """
-    tenant_id = os.getenv("TENANT_ID")
-    client_id = os.getenv("CLIENT_ID")
-    scope = os.getenv("OAUTH2_SCOPE", "api://08eeb6a4-4aee-406f-baa5-4922993f09f3/.default")
-
-    if not tenant_id or not client_id:
+    if not CFG.tenant_id or not CFG.client_id:
         raise ValueError("TENANT_ID and CLIENT_ID must be set in .env file")
 
-    device_auth_url = f"https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/devicecode"
+    logger.info(f"Initiating device flow for client_id: {CFG.client_id}")
 
-    logger.info(f"Initiating device flow for client_id: {client_id}")
+    client = get_client()
+    response = await client.post(
+        CFG.device_auth_url,
+        data=_DEVICE_FLOW_DATA,
+        headers=_FORM_HEADERS
+    )
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            device_auth_url,
-            data={
-                "client_id": client_id,
-                "scope": scope
-            },
-            headers={"Content-Type": "application/x-www-form-urlencoded"}
-        )
+    if response.status_code != 200:
+        detail = response.text
+        logger.error(f"Device flow initiation failed: {response.status_code} - {detail}")
+        raise Exception(f"Failed to initiate device flow: {detail}")
+
+    logger.debug("Device flow response negotiated over %s", response.http_version)
 
-        if response.status_code != 200:
-            logger.error(f"Device flow initiation failed: {response.status_code} - {response.text}")
-            raise Exception(f"Failed to initiate device flow: {response.text}")
+    result = orjson.loads(response.content)
+    logger.info(f"Device flow initiated successfully. User code: {result.get('user_code')}")
+    return result
 
-        result = response.json()
-        logger.info(f"Device flow initiated successfully. User code: {result.get('user_code')}")
-        return result
 
+# Prior on how long users take to finish signing in: log-normal with a median
+# of 45 seconds. Used to place a fixed budget of polls where a login is most
+# likely to complete, instead of polling at a constant interval.
+_POLL_BUDGET = 20
+_COMPLETION_MU = math.log(45)
+_COMPLETION_SIGMA = 1.0
 
-async def poll_for_token(device_code: str, interval: int = 5, max_attempts: int = 60) -> Dict[str, Any]:
+# Random extra delay added to each poll so concurrent clients don't poll in lockstep
+_POLL_JITTER = 0.5
+
+# Seconds before the deadline at which the last poll is made
+_POLL_DEADLINE_MARGIN = 1.0
+
+
+def _lognormal_pdf(t: float, mu: float, sigma: float) -> float:
+    if t <= 0:
+        return 0.0
+    z = (math.log(t) - mu) / sigma
+    return math.exp(-0.5 * z * z) / (t * sigma * math.sqrt(2 * math.pi))
+
+
+def _lognormal_cdf(t: float, mu: float, sigma: float) -> float:
+    if t <= 0:
+        return 0.0
+    return 0.5 * (1 + math.erf((math.log(t) - mu) / (sigma * math.sqrt(2))))
+
+
+def adaptive_poll_schedule(expires_in: float, budget: int = _POLL_BUDGET,
+                           mu: float = _COMPLETION_MU, sigma: float = _COMPLETION_SIGMA,
+                           elapsed: float = 0.0) -> List[float]:
     """
-    Step 2: Poll the token endpoint until the user completes authentication.
+    Compute the gaps between token polls that minimise expected detection delay.
+
+    Poll times follow L_i = L_{i-1} + (F(L_{i-1}) - F(L_{i-2})) / p(L_{i-1}) for a
+    log-normal completion-time density p with CDF F, measured from when the
+    device code was issued. The first poll time is chosen by bisection so that
+    `budget` polls fit within `expires_in`.
+
+    If `elapsed` seconds have already passed without the user completing, the
+    prior is conditioned on that. Conditioning scales F and p by the same
+    factor, so the recursion is unchanged and only starts at `elapsed`.
 
     Args:
-        device_code: The device code from initiate_device_flow
-        interval: Polling interval in seconds (default: 5)
-        max_attempts: Maximum number of polling attempts (default: 60 = 5 minutes)
+        expires_in: Seconds until the device code expires
+        budget: Number of polls to place
+        mu: Mean of the log of the completion time
+        sigma: Standard deviation of the log of the completion time
+        elapsed: Seconds since the device code was issued
 
     Returns:
-        Token response including access_token
+        Seconds to wait before each successive poll
     """
-    tenant_id = os.getenv("TENANT_ID")
-    client_id = os.getenv("CLIENT_ID")
-
-    token_url = f"https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/token"
-
-    logger.info(f"Starting token polling (interval: {interval}s, max_attempts: {max_attempts})")
-    logger.debug(f"Token URL: {token_url}")
-    logger.debug(f"Client ID: {client_id}")
-    logger.debug(f"Device code (first 10 chars): {device_code[:10]}...")
-
-    async with httpx.AsyncClient() as client:
-        for attempt in range(max_attempts):
-            logger.debug(f"Polling attempt {attempt + 1}/{max_attempts}")
-
-            response = await client.post(
-                token_url,
-                data={
-                    "grant_type": "urn:ietf:params:oauth:grant-type:device_code",
-                    "client_id": client_id,
-                    "device_code": device_code
-                },
-                headers={"Content-Type": "application/x-www-form-urlencoded"}
-            )
+    horizon = elapsed + expires_in
+
+    def poll_times(first: float) -> List[float]:
+        times = [elapsed, first]
+        while len(times) <= budget:
+            prev, last = times[-2], times[-1]
+            density = _lognormal_pdf(last, mu, sigma)
+            if density <= 0:
+                break
+            step = (_lognormal_cdf(last, mu, sigma) - _lognormal_cdf(prev, mu, sigma)) / density
+            if last + step >= horizon:
+                break
+            times.append(last + step)
+        return times[1:]
+
+    lo, hi = float(elapsed), float(horizon)
+    for _ in range(50):
+        mid = (lo + hi) / 2
+        if len(poll_times(mid)) < budget:
+            hi = mid
+        else:
+            lo = mid
+
+    times = poll_times(lo)
+    return [b - a for a, b in zip([elapsed] + times, times)]
 
-            result = response.json()
 
-            # Log all non-200 responses for debugging
-            if response.status_code != 200:
-                logger.debug(f"Token endpoint returned {response.status_code}: {result}")
+async def poll_for_token(device_code: str, interval: int, expires_in: float,
+                         pending: Optional[Dict[str, Any]] = None,
+                         elapsed: float = 0.0) -> Dict[str, Any]:
+    """
+    Step 2: Poll the token endpoint until the user completes authentication.
 
-            if response.status_code == 200:
-                # Success! We got the token
-                logger.info("✅ Token acquired successfully!")
-                return result
+    Polls until the device code expires, as prescribed by RFC 8628. The first
+    poll is immediate; later polls follow adaptive_poll_schedule() but never
+    come sooner than the server-provided interval, plus a little random jitter.
+    No wait runs past the deadline, so a last poll is made just before the
+    code expires.
+    A slow_down response permanently doubles the interval (by at least 5
+    seconds), and the new interval is written back to `pending` so later
+    complete_device_auth calls start from it.
 
-            # Check for specific errors
-            error = result.get("error", "")
+    Args:
+        device_code: The device code from initiate_device_flow
+        interval: Server-provided polling interval in seconds
+        expires_in: Seconds until the device code expires
+        pending: Optional pending-flow entry whose "interval" tracks slow_down responses
+        elapsed: Seconds since the device code was issued
 
-            if error == "authorization_pending":
-                # User hasn't completed authentication yet, keep polling
+    Returns:
+        Token response including access_token
+    """
+    deadline = time.monotonic() + expires_in
+    delays = iter(adaptive_poll_schedule(expires_in, elapsed=elapsed))
+
+    logger.info(f"Starting token polling (interval: {interval}s, expires_in: {int(expires_in)}s)")
+    # Checked once so the polling loop skips the debug calls entirely when disabled
+    debug = logger.isEnabledFor(logging.DEBUG)
+    if debug:
+        logger.debug("Token URL: %s", CFG.token_url)
+        logger.debug("Client ID: %s", CFG.client_id)
+        logger.debug("Device code (first 10 chars): %s...", device_code[:10])
+
+    # The request never changes between attempts, so encode it once and resend it
+    client = get_client()
+    request = client.build_request(
+        "POST",
+        CFG.token_url,
+        data={
+            "grant_type": _DEVICE_GRANT,
+            "client_id": CFG.client_id,
+            "device_code": device_code
+        },
+        headers=_FORM_HEADERS
+    )
+    attempt = 0
+    while time.monotonic() < deadline:
+        attempt += 1
+        if debug:
+            logger.debug("Polling attempt %d", attempt)
+
+        response = await client.send(request)
+
+        result = orjson.loads(response.content)
+
+        if response.status_code == 200:
+            # Success! We got the token
+            logger.info("✅ Token acquired successfully!")
+            return result
+
+        # Log all non-200 responses for debugging
+        if debug:
+            logger.debug("Token endpoint returned %d: %s", response.status_code, result)
+
+        # Check for specific errors
+        error = result.get("error", "")
+
+        if error == "authorization_pending":
+            # User hasn't completed authentication yet, keep polling
+            if debug:
                 logger.debug("Authorization pending, waiting...")
-                await asyncio.sleep(interval)
-                continue
-            elif error == "slow_down":
-                # Server asked us to slow down, increase interval
-                interval += 5
-                logger.warning(f"Server requested slow down, increasing interval to {interval}s")
-                await asyncio.sleep(interval)
-                continue
-            elif error == "authorization_declined":
-                logger.error("User declined the authorization")
-                raise Exception("User declined the authorization")
-            elif error == "expired_token":
-                logger.error("Device code expired")
-                raise Exception("Device code expired, please restart the flow")
-            else:
-                logger.error(f"Token polling failed: {error} - {result.get('error_description', '')}")
-                raise Exception(f"Token acquisition failed: {error}")
-
-        raise Exception(f"Token polling timed out after {max_attempts} attempts")
-
-
-# COMMENTED OUT: File-based token storage is deprecated - tokens are now handled in conversation context
-# def save_bearer_token(token_data: Dict[str, Any], filename: str = "bearer_token.txt") -> str:
-#     """
-#     Save the bearer token to a text file.
-#
-#     Args:
-#         token_data: The token response from poll_for_token
-#         filename: The filename to save to (default: bearer_token.txt)
-#
-#     Returns:
-#         Path to the saved file
-#     """
-#     script_dir = os.path.dirname(os.path.abspath(__file__))
-#     file_path = os.path.join(script_dir, filename)
-#
-#     access_token = token_data.get("access_token", "")
-#
-#     with open(file_path, 'w') as f:
-#         f.write(access_token)
-#
-#     logger.info(f"Bearer token saved to: {file_path}")
-#     return file_path
+        elif error == "slow_down":
+            # Server asked us to slow down: back off exponentially (RFC 8628 requires at least +5s)
+            interval = max(interval * 2, interval + 5)
+            if pending is not None:
+                pending["interval"] = interval
+            logger.warning(f"Server requested slow down, increasing interval to {interval}s")
+        elif error == "authorization_declined":
+            logger.error("User declined the authorization")
+            raise Exception("User declined the authorization")
+        elif error == "expired_token":
+            logger.error("Device code expired")
+            raise Exception("Device code expired, please restart the flow")
+        else:
+            logger.error(f"Token polling failed: {error} - {result.get('error_description', '')}")
+            raise Exception(f"Token acquisition failed: {error}")
+
+        # Still pending: wait for the next scheduled poll, never sooner than the
+        # interval, and cut the wait short so the last poll lands before expiry
+        delay = max(next(delays, interval), interval)
+        delay = max(min(delay, deadline - time.monotonic() - _POLL_DEADLINE_MARGIN), interval)
+        await asyncio.sleep(delay + random.uniform(0, _POLL_JITTER))
+
+    raise Exception(f"Token polling timed out after {attempt} attempts: device code expired")
 
 
 @mcp.tool()
@@ -443,30 +744,25 @@ async def start_device_auth() -> str:
         expires_in = device_info.get("expires_in", 900)
         interval = device_info.get("interval", 5)
 
-        # Save device_code to file so complete_device_auth can use it
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        device_code_file = os.path.join(script_dir, "device_code.txt")
-        with open(device_code_file, 'w') as f:
-            f.write(json.dumps({
-                "device_code": device_code,
-                "interval": interval,
-                "expires_in": expires_in
-            }))
+        # Forget flows whose codes have expired, then remember this one
+        # so complete_device_auth can use it
+        now = time.monotonic()
+        for expired in [code for code, pending in _DEVICE_CODE_CACHE.items() if now >= pending["expires_at"]]:
+            del _DEVICE_CODE_CACHE[expired]
+        _DEVICE_CODE_CACHE[user_code] = {
+            "device_code": device_code,
+            "interval": interval,
+            "issued_at": now,
+            "expires_at": now + expires_in
+        }
 
         # Build user instructions
-        instructions = f"""
-DEVICE AUTHENTICATION REQUIRED
-
-Please complete these steps:
-
-1. Go to: {verification_uri}
-2. Enter code: {user_code}
-3. Sign in with your Microsoft credentials
-
-Code expires in: {expires_in} seconds ({int(expires_in/60)} minutes)
-
-After you complete authentication, ask me to "complete device authentication" to retrieve the token.
-"""
+        instructions = _INSTRUCTIONS_TEMPLATE.format(
+            verification_uri=verification_uri,
+            user_code=user_code,
+            expires_in=expires_in,
+            minutes=int(expires_in/60)
+        )
 
         response = {
             "status": "pending",
@@ -478,56 +774,62 @@ After you complete authentication, ask me to "complete device authentication" to
         }
 
         logger.info(f"Device flow initiated. User code: {user_code}")
-        return json.dumps(response, indent=2)
+        return _dump(response)
 
     except Exception as e:
         logger.error(f"Failed to start device auth flow: {str(e)}")
-        return json.dumps({
-            "status": "error",
-            "message": str(e),
-            "error_type": type(e).__name__
-        }, indent=2)
+        return _error_response(str(e), type(e).__name__)
 
 
 @mcp.tool()
-async def complete_device_auth() -> str:
+async def complete_device_auth(user_code: str = None) -> str:
     """
     STEP 2: Complete the device authentication and retrieve the bearer token.
 
     Call this function AFTER the user has completed authentication in their browser.
-    This will poll for the token and save it to bearer_token.txt.
+    This will poll for the token and return it in the response.
+
+    Args:
+        user_code: User code returned by start_device_auth (default: the most recently started flow)
 
     Returns:
         JSON with token information or error
     """
     try:
-        # Read device_code from file
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        device_code_file = os.path.join(script_dir, "device_code.txt")
-
-        if not os.path.exists(device_code_file):
-            return json.dumps({
-                "status": "error",
-                "message": "Device code not found. Please run start_device_auth() first.",
-                "error_type": "FileNotFoundError"
-            }, indent=2)
+        if user_code is None and _DEVICE_CODE_CACHE:
+            user_code = next(reversed(_DEVICE_CODE_CACHE))
+        device_data = _DEVICE_CODE_CACHE.get(user_code)
+
+        if device_data is None:
+            return _error_response(
+                "Device code not found. Please run start_device_auth() first.",
+                "FileNotFoundError"
+            )
 
-        with open(device_code_file, 'r') as f:
-            device_data = json.loads(f.read())
+        if time.monotonic() >= device_data["expires_at"]:
+            _DEVICE_CODE_CACHE.pop(user_code, None)
+            return _error_response(
+                "Device code expired. Please run start_device_auth() again.",
+                "TimeoutError"
+            )
 
         device_code = device_data.get("device_code")
         interval = device_data.get("interval", 5)
 
         logger.info("Polling for token...")
 
-        # Poll for token
-        token_data = await poll_for_token(device_code, interval, max_attempts=5)
-
-        # Save bearer token - COMMENTED OUT: Token stays in conversation context only
-        # token_file = save_bearer_token(token_data)
+        # Poll for token, accounting for the time already spent since start_device_auth
+        now = time.monotonic()
+        token_data = await poll_for_token(
+            device_code,
+            interval,
+            expires_in=device_data["expires_at"] - now,
+            pending=device_data,
+            elapsed=now - device_data["issued_at"]
+        )
 
-        # Clean up device code file
-        os.remove(device_code_file)
+        # Device code is single-use; forget it
+        _DEVICE_CODE_CACHE.pop(user_code, None)
 
         # Prepare response with FULL access token for use in conversation
         response = {
@@ -544,30 +846,26 @@ async def complete_device_auth() -> str:
         logger.info("Token returned in response (not saved to file)")
         logger.info("=" * 80)
 
-        return json.dumps(response, indent=2)
+        return _dump(response)
 
     except Exception as e:
         logger.error(f"Failed to complete device auth: {str(e)}")
-        return json.dumps({
-            "status": "error",
-            "message": str(e),
-            "error_type": type(e).__name__
-        }, indent=2)
+        return _error_response(str(e), type(e).__name__)
 
 
-@mcp.tool()
 async def device_auth_flow() -> str:
     """
     Execute the complete OAuth 2.0 Device Authorization Grant Flow (ONE-STEP VERSION).
 
-    WARNING: This function will block while waiting for user authentication (up to 5 minutes).
+    WARNING: This function will block while waiting for user authentication (until the code expires).
     For better user experience, use start_device_auth() and complete_device_auth() separately.
+    Only exposed as an MCP tool when ENABLE_ONE_STEP_DEVICE_FLOW=true.
 
     This function will:
     1. Initiate the device flow and get a user code
     2. Display the user code and verification URL
     3. Poll for the token while waiting for user to complete authentication
-    4. Save the bearer token to bearer_token.txt
+    4. Return the bearer token in the response
 
     Returns:
         JSON string with status and token information
@@ -587,27 +885,17 @@ async def device_auth_flow() -> str:
         interval = device_info.get("interval", 5)
 
         # Build instructions for response
-        instructions = f"""
-DEVICE AUTHENTICATION REQUIRED
-
-Please complete authentication NOW:
-
-1. Go to: {verification_uri}
-2. Enter code: {user_code}
-3. Sign in with your credentials
-
-Code expires in: {expires_in} seconds
-Polling for token (this may take up to 5 minutes)...
-"""
+        instructions = _ONE_STEP_INSTRUCTIONS_TEMPLATE.format(
+            verification_uri=verification_uri,
+            user_code=user_code,
+            expires_in=expires_in
+        )
 
         logger.info(instructions)
 
         # Step 2: Poll for token (with shorter timeout for responsiveness)
         try:
-            token_data = await poll_for_token(device_code, interval, max_attempts=60)
-
-            # Step 3: Save bearer token - COMMENTED OUT: Token stays in conversation context only
-            # token_file = save_bearer_token(token_data)
+            token_data = await poll_for_token(device_code, interval, expires_in)
 
             # Prepare success response with FULL access token
             response = {
@@ -623,11 +911,11 @@ Polling for token (this may take up to 5 minutes)...
             logger.info("✅ Device authentication flow completed!")
             logger.info("Token returned in response (not saved to file)")
 
-            return json.dumps(response, indent=2)
+            return _dump(response)
 
         except Exception as poll_error:
             # Return the instructions even if polling fails
-            return json.dumps({
+            return _dump({
                 "status": "pending",
                 "message": "Authentication instructions displayed, but token polling failed or timed out",
                 "instructions": instructions,
@@ -635,15 +923,17 @@ Polling for token (this may take up to 5 minutes)...
                 "verification_uri": verification_uri,
                 "error": str(poll_error),
                 "suggestion": "Try using start_device_auth() and complete_device_auth() for better control"
-            }, indent=2)
+            })
 
     except Exception as e:
         logger.error(f"Device authentication flow failed: {str(e)}")
-        return json.dumps({
-            "status": "error",
-            "message": str(e),
-            "error_type": type(e).__name__
-        }, indent=2)
+        return _error_response(str(e), type(e).__name__)
+
+
+# The one-step flow duplicates start/complete_device_auth, so keep it out of the
+# tool list sent to the model unless explicitly enabled
+if ENABLE_ONE_STEP_DEVICE_FLOW:
+    mcp.tool()(device_auth_flow)
 
 
 # =============================================================================
@@ -673,34 +963,43 @@ async def get_azure_token(scope: str = None) -> str:
 
 
 @mcp.tool()
-async def get_azure_token_info(scope: str = None) -> str:
+async def get_azure_token_info(scope: str = None, refresh: bool = False) -> str:
     """
     Get detailed Azure OAuth2 token information including expiry.
 
+    Reports on the cached token when there is one, without contacting Azure AD.
+
     Args:
         scope: OAuth2 scope (default: from OAUTH2_SCOPE env var or Microsoft Graph API)
+        refresh: Fetch a new token even if a cached one is still valid (default: False)
 
     Returns:
         JSON string with token details
     """
     try:
-        token_data = await get_cached_token(scope)
+        entry = None
+        if oauth_client and CFG.auth_method == "CLIENT_CREDENTIALS":
+            key = _token_cache_key(scope)
+            entry = await _refresh_token(key, force=True) if refresh else _TOKEN_CACHE.get(key)
+        # Served from cache only if this scope's token was already there
+        cached = entry is not None and not refresh
+        token_data = entry.token_data if entry is not None else await get_cached_token(scope)
 
         # Get authentication method
-        auth_method = os.getenv("AUTH_METHOD", "DEVICE_CODE").upper()
+        auth_method = CFG.auth_method
 
         # Prepare response data (excluding sensitive information)
         info = {
             "auth_method": auth_method,
             "token_type": token_data.get("token_type", "Bearer"),
             "expires_in": token_data.get("expires_in"),
-            "expires_at": token_data.get("expires_at").isoformat() if "expires_at" in token_data else None,
+            "expires_at": token_data.get("expires_at"),
             "scope": token_data.get("scope"),
             "access_token_preview": f"{token_data['access_token'][:20]}..." if "access_token" in token_data else None,
-            "cached": _cached_token is not None
+            "cached": cached
         }
 
-        return json.dumps(info, indent=2)
+        return _dump(info)
     except Exception as e:
         return f"Error getting token info: {str(e)}"
 
@@ -729,18 +1028,33 @@ async def test_azure_token(api_endpoint: str = "https://graph.microsoft.com/v1.0
             "Content-Type": "application/json"
         }
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(api_endpoint, headers=headers, timeout=30.0)
+        client = get_client()
+        response = await client.get(api_endpoint, headers=headers, timeout=30.0)
 
-            if response.status_code == 200:
-                return f"Token test successful!\nStatus: {response.status_code}\nResponse: {response.text[:500]}..."
-            else:
-                return f"Token test failed!\nStatus: {response.status_code}\nResponse: {response.text}"
+        if response.status_code == 200:
+            return f"Token test successful!\nStatus: {response.status_code}\nResponse: {response.text[:500]}..."
+        else:
+            return f"Token test failed!\nStatus: {response.status_code}\nResponse: {response.text}"
 
     except Exception as e:
         return f"Error testing token: {str(e)}"
 
 
+# Fixed part of the check_auth_config report in DEVICE_CODE mode
+_DEVICE_CODE_CONFIG = {
+    "status": "VALID",
+    "note": "Device Code mode: Automatic token acquisition disabled. Must pass bearer_token parameter.",
+    "workflow": [
+        "1. Run 'start device authentication'",
+        "2. Complete authentication at microsoft.com/devicelogin",
+        "3. Run 'complete device authentication' to get token",
+        "4. Pass token as parameter to functions"
+    ],
+    "usage_example": "Pass bearer_token='eyJ0...' as parameter to functions that need authentication",
+    "token_source": "conversation_context (no file storage)"
+}
+
+
 @mcp.tool()
 async def check_auth_config() -> str:
     """
@@ -753,22 +1067,22 @@ async def check_auth_config() -> str:
         JSON string with authentication configuration details
     """
     try:
-        auth_method = os.getenv("AUTH_METHOD", "DEVICE_CODE").upper()
+        auth_method = CFG.auth_method
 
         config = {
             "auth_method": auth_method,
-            "tenant_id": os.getenv("TENANT_ID", "NOT_SET"),
-            "client_id": os.getenv("CLIENT_ID", "NOT_SET"),
-            "oauth2_scope": os.getenv("OAUTH2_SCOPE", "NOT_SET"),
+            "tenant_id": CFG.tenant_id or "NOT_SET",
+            "client_id": CFG.client_id or "NOT_SET",
+            "oauth2_scope": CFG.scope or "NOT_SET",
         }
 
         if auth_method == "CLIENT_CREDENTIALS":
-            config["client_secret_set"] = bool(os.getenv("CLIENT_SECRET"))
-            config["access_token_url"] = os.getenv("ACCESS_TOKEN_URL", "NOT_SET")
+            config["client_secret_set"] = bool(CFG.client_secret)
+            config["access_token_url"] = CFG.access_token_url or "NOT_SET"
 
             # Validate required settings
             missing = []
-            if not os.getenv("CLIENT_SECRET"):
+            if not CFG.client_secret:
                 missing.append("CLIENT_SECRET")
             if config["tenant_id"] == "NOT_SET":
                 missing.append("TENANT_ID")
@@ -782,78 +1096,35 @@ async def check_auth_config() -> str:
                 config["status"] = "VALID"
 
         elif auth_method == "DEVICE_CODE":
-            config["status"] = "VALID"
-            config["note"] = "Device Code mode: Automatic token acquisition disabled. Must pass bearer_token parameter."
-            config["workflow"] = [
-                "1. Run 'start device authentication'",
-                "2. Complete authentication at microsoft.com/devicelogin",
-                "3. Run 'complete device authentication' to get token",
-                "4. Pass token as parameter to functions"
-            ]
-            config["usage_example"] = "Pass bearer_token='eyJ0...' as parameter to functions that need authentication"
-            config["token_source"] = "conversation_context (no file storage)"
+            config.update(_DEVICE_CODE_CONFIG)
 
         else:
             config["status"] = "INVALID"
             config["error"] = f"Invalid AUTH_METHOD '{auth_method}'. Must be 'CLIENT_CREDENTIALS' or 'DEVICE_CODE'"
 
-        # Check if token is currently cached
-        config["token_cached"] = _cached_token is not None
-        if _cached_token and "expires_at" in _cached_token:
-            config["cached_token_expires_at"] = _cached_token["expires_at"].isoformat()
-            config["cached_token_valid"] = datetime.now() < _cached_token["expires_at"]
+        # Check if a token is currently cached for the default scope, and which scopes have one
+        entry = None
+        if oauth_client:
+            entry = _TOKEN_CACHE.get(_token_cache_key(None))
+        config["token_cached"] = entry is not None
+        if entry is not None:
+            config["cached_token_expires_at"] = entry.token_data["expires_at"]
+            config["cached_token_valid"] = time.monotonic() < entry.expires_at
+        config["cached_scopes"] = [scope for _, _, scope in _TOKEN_CACHE]
 
-        return json.dumps(config, indent=2)
+        return _dump(config)
 
     except Exception as e:
-        return json.dumps({
+        return _dump({
             "status": "ERROR",
             "error": str(e),
             "error_type": type(e).__name__
-        }, indent=2)
-
-
-# COMMENTED OUT: File-based token storage is deprecated - tokens are now handled in conversation context
-# @mcp.tool()
-# def read_bearer_token() -> str:
-#     """
-#     Read the bearer token from bearer_token.txt file.
-#
-#     Returns:
-#         JSON string with the bearer token
-#     """
-#     try:
-#         script_dir = os.path.dirname(os.path.abspath(__file__))
-#         file_path = os.path.join(script_dir, "bearer_token.txt")
-#
-#         if not os.path.exists(file_path):
-#             return json.dumps({
-#                 "status": "error",
-#                 "message": "Bearer token file not found. Run device_auth_flow first.",
-#                 "file_path": file_path
-#             }, indent=2)
-#
-#         with open(file_path, 'r') as f:
-#             token = f.read().strip()
-#
-#         return json.dumps({
-#             "status": "success",
-#             "token": token,
-#             "token_preview": token[:50] + "..." if len(token) > 50 else token,
-#             "file_path": file_path
-#         }, indent=2)
-#
-#     except Exception as e:
-#         logger.error(f"Failed to read bearer token: {str(e)}")
-#         return json.dumps({
-#             "status": "error",
-#             "message": str(e),
-#             "error_type": type(e).__name__
-#         }, indent=2)
+        })
+
 
 if __name__ == "__main__":
     # Run the server
-    auth_method = os.getenv("AUTH_METHOD", "DEVICE_CODE").upper()
+    auth_method = CFG.auth_method
     logger.info("=" * 80)
     logger.info("Starting OAuth MCP Server...")
     logger.info(f"Authentication Method: {auth_method}")
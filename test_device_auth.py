@@ -6,7 +6,7 @@ This script tests the device authentication flow without needing MCP.
 """
 
 import asyncio
-from server import device_auth_flow, read_bearer_token
+from server import device_auth_flow
 
 async def main():
     print("=" * 80)
@@ -20,16 +20,6 @@ async def main():
 
     result = await device_auth_flow()
     print(result)
-    print()
-
-    # Try to read the token
-    print("=" * 80)
-    print("Reading saved bearer token...")
-    print("=" * 80)
-    print()
-
-    token_result = read_bearer_token()
-    print(token_result)
 
 if __name__ == "__main__":
     asyncio.run(main())
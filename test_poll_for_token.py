@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Fake-clock tests for the device flow token polling.
+
+Time only advances when poll_for_token sleeps, so a full 15-minute device code
+lifetime runs instantly. Run with: python -m unittest test_poll_for_token
+"""
+
+import asyncio
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import httpx
+
+# Keep the server's log file out of the working tree
+os.environ["LOG_FILE"] = os.path.join(tempfile.mkdtemp(), "oauth_mcp_server.log")
+
+import server
+
+
+class FakeClock:
+    """Monotonic clock that only moves when the code under test sleeps."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, delay: float) -> None:
+        self.now += delay
+
+
+class PollForTokenTest(unittest.TestCase):
+
+    def run_poll(self, completes_at: float, expires_in: float = 900, interval: int = 5,
+                 elapsed: float = 0.0):
+        """Poll until the fake user completes `completes_at` seconds after the code was issued."""
+        clock = FakeClock()
+        issued_at = clock.now - elapsed
+        polls = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            polls.append(clock.now)
+            if clock.now - issued_at >= completes_at:
+                return httpx.Response(200, json={"access_token": "token", "token_type": "Bearer"})
+            return httpx.Response(400, json={"error": "authorization_pending"})
+
+        async def poll():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+                fake_time = SimpleNamespace(monotonic=clock.monotonic)
+                fake_asyncio = SimpleNamespace(sleep=clock.sleep)
+                with mock.patch.object(server, "_HTTP_CLIENT", client), \
+                        mock.patch.object(server, "time", fake_time), \
+                        mock.patch.object(server, "asyncio", fake_asyncio):
+                    return await server.poll_for_token("DEVICE", interval, expires_in, elapsed=elapsed)
+
+        try:
+            result = asyncio.run(poll())
+        except Exception as e:
+            result = e
+        return result, [t - issued_at for t in polls]
+
+    def test_completion_late_in_lifetime_is_detected(self):
+        for completes_at in (660, 800, 890):
+            with self.subTest(completes_at=completes_at):
+                result, polls = self.run_poll(completes_at)
+                self.assertEqual(result["access_token"], "token")
+                self.assertLess(polls[-1], 900)
+
+    def test_last_poll_happens_just_before_expiry(self):
+        result, polls = self.run_poll(completes_at=float("inf"))
+        self.assertIsInstance(result, Exception)
+        self.assertIn("timed out", str(result))
+        self.assertGreater(polls[-1], 900 - server._POLL_DEADLINE_MARGIN - server._POLL_JITTER - 5)
+        self.assertLess(polls[-1], 900)
+
+    def test_polls_respect_interval(self):
+        _, polls = self.run_poll(completes_at=float("inf"), interval=5)
+        gaps = [b - a for a, b in zip(polls, polls[1:])]
+        self.assertGreaterEqual(min(gaps), 5)
+
+    def test_resumed_flow_polls_within_remaining_lifetime(self):
+        result, polls = self.run_poll(completes_at=700, expires_in=600, elapsed=300)
+        self.assertEqual(result["access_token"], "token")
+        self.assertGreaterEqual(polls[0], 300)
+        self.assertLess(polls[-1], 900)
+
+
+class AdaptivePollScheduleTest(unittest.TestCase):
+
+    def test_schedule_fits_within_lifetime(self):
+        gaps = server.adaptive_poll_schedule(900)
+        self.assertEqual(len(gaps), server._POLL_BUDGET)
+        self.assertLess(sum(gaps), 900)
+        self.assertTrue(all(gap > 0 for gap in gaps))
+
+    def test_schedule_is_conditioned_on_elapsed_time(self):
+        gaps = server.adaptive_poll_schedule(600, elapsed=300)
+        self.assertLess(sum(gaps), 600)
+        # Past the bulk of the prior, polls are spread out rather than packed near zero
+        self.assertNotEqual(gaps, server.adaptive_poll_schedule(600))
+
+
+if __name__ == "__main__":
+    unittest.main()